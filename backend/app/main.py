@@ -6,24 +6,73 @@ TikTok profiles and identifying songs.
 """
 
 import os
+import re
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import logging
+from contextlib import asynccontextmanager
+from functools import cache
 
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.models.schemas import ScrapeRequest, ScrapeResponse, SongResult, HealthResponse
-from app.services.scraper import TikTokScraper
-from app.services.processor import SongProcessor
+from app.models.schemas import ScrapeRequest, ScrapeResponse, HealthResponse
+from app.services.scraper import BrowserPool, TikTokScraper
+from app.services.processor import SongProcessor, title_key
+from app.services.cache import SemanticCache, TTLCache
+
+# Scraper progress goes through logging; uvicorn leaves the root logger bare
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(levelname)s:     %(name)s - %(message)s"
+)
+
+# Concurrent scrapes (one pooled browser context each in the shared browser).
+# Capped to avoid thrashing smaller hosts with too many open pages.
+MAX_SCRAPER_POOL_SIZE = 16
+SCRAPER_POOL_SIZE = max(1, min(int(os.getenv("SCRAPER_POOL_SIZE", "8")), MAX_SCRAPER_POOL_SIZE))
+browser_pool = BrowserPool(
+    size=SCRAPER_POOL_SIZE,
+    headless=os.getenv("HEADLESS", "false").lower() == "true",
+    storage_state_path=os.path.join(
+        "/app/output" if os.path.isdir("/app/output") else ".",
+        TikTokScraper.STORAGE_STATE_FILE
+    )
+)
+
+# TikTok usernames: letters, digits, underscores and periods
+USERNAME_PATTERN = re.compile(r"[A-Za-z0-9_.]{1,50}")
+
+
+@cache
+def get_song_cache() -> SemanticCache:
+    """Song classifications shared across requests, opened on first use."""
+    return SemanticCache()
+
+
+# One Gemini quota for the whole process, however many requests are in flight
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "60"))
+gemini_rate_limiter = SongProcessor.make_rate_limiter(GEMINI_RPM)
+
+# Finished /scrape responses, keyed by username and AI flag
+response_cache = TTLCache(ttl=int(os.getenv("SCRAPE_CACHE_TTL", "3600")))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Close the browser shared by all scrapes on shutdown."""
+    try:
+        yield
+    finally:
+        await browser_pool.close()
 
-# Thread pool for running sync scraper
-executor = ThreadPoolExecutor(max_workers=2)
 
 # FastAPI app
 app = FastAPI(
     title="TikTok Song Scraper API",
     description="Scrape audio/song titles from TikTok profiles and identify real songs using AI",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -46,36 +95,37 @@ app.add_middleware(
 )
 
 
-# Helper functions for running sync code in thread pool
-def run_scraper(username: str) -> list[str]:
-    """Run the scraper in a separate thread (sync code)."""
+# Pipeline helpers
+async def run_scraper(username: str) -> list[str]:
+    """Run the scraper on the event loop, borrowing a context from the shared pool."""
     scraper = TikTokScraper(username)
-    scraper.scrape_songs()
+    await scraper.scrape_songs_async(pool=browser_pool)
     return scraper.songs
 
 
-def run_processor(raw_titles: list[str], api_key: str) -> list[dict]:
-    """Run the AI processor in a separate thread (sync code)."""
-    processor = SongProcessor(api_key)
-    processed_results = processor.process_songs(raw_titles)
+async def run_processor(raw_titles: list[str], api_key: str) -> list[dict]:
+    """Run the AI processor, sending Gemini batches concurrently."""
+    # Opening the cache loads it from SQLite, so keep that off the event loop
+    song_cache = await asyncio.to_thread(get_song_cache)
+    processor = SongProcessor(
+        api_key,
+        cache=song_cache,
+        rate_limiter=gemini_rate_limiter
+    )
+    processed_results = await processor.aprocess_songs(raw_titles)
     return processor.format_song_list(processed_results)
 
 
 # Routes
 @app.get("/", response_model=HealthResponse)
-async def root():
-    """Health check endpoint."""
-    return HealthResponse(status="healthy")
-
-
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
-    """Health check for Cloud Run."""
+    """Health check endpoint (also used by Cloud Run)."""
     return HealthResponse(status="healthy")
 
 
 @app.post("/scrape", response_model=ScrapeResponse)
-async def scrape_profile(request: ScrapeRequest):
+async def scrape_profile(request: ScrapeRequest, force_refresh: bool = False):
     """
     Scrape a TikTok profile for songs.
     
@@ -84,6 +134,9 @@ async def scrape_profile(request: ScrapeRequest):
     2. Click through all videos and extract audio titles
     3. Optionally process with Gemini AI to identify real songs
     
+    Results are cached per username for SCRAPE_CACHE_TTL seconds; pass
+    `?force_refresh=true` to bypass the cache.
+    
     Note: This operation may take several minutes depending on the number of videos.
     """
     username = request.username.strip().lstrip("@")
@@ -91,13 +144,17 @@ async def scrape_profile(request: ScrapeRequest):
     if not username:
         raise HTTPException(status_code=400, detail="Username cannot be empty")
     
-    if not username.replace("_", "").replace(".", "").isalnum():
+    if not USERNAME_PATTERN.fullmatch(username):
         raise HTTPException(status_code=400, detail="Invalid username format")
     
+    cache_key = f"{username.lower()}:{request.process_with_ai}"
+    if not force_refresh:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return ORJSONResponse(cached)
+    
     try:
-        # Run scraper in thread pool
-        loop = asyncio.get_event_loop()
-        raw_titles = await loop.run_in_executor(executor, run_scraper, username)
+        raw_titles = await run_scraper(username)
         
         if not raw_titles:
             return ScrapeResponse(
@@ -118,35 +175,25 @@ async def scrape_profile(request: ScrapeRequest):
             gemini_api_key = os.getenv("GEMINI_API_KEY")
             
             if gemini_api_key:
-                formatted = await loop.run_in_executor(
-                    executor, 
-                    run_processor, 
-                    raw_titles, 
-                    gemini_api_key
-                )
-                
-                processed_songs = [
-                    SongResult(
-                        song=s.get("song"),
-                        artist=s.get("artist"),
-                        type=s.get("type", "unknown"),
-                        confidence=s.get("confidence"),
-                        tiktok_title=s.get("tiktok_title", "")
-                    )
-                    for s in formatted
-                ]
+                processed_songs = await run_processor(raw_titles, gemini_api_key)
                 real_songs_count = len(processed_songs)
         
-        return ScrapeResponse(
-            username=username,
-            total_videos_scraped=len(raw_titles),
-            total_unique_titles=len(raw_titles),
-            real_songs_identified=real_songs_count,
-            raw_titles=raw_titles,
-            processed_songs=processed_songs,
-            message=f"Successfully scraped {len(raw_titles)} unique audio titles" + 
-                    (f" and identified {real_songs_count} real songs" if processed_songs else "")
-        )
+        unique_count = len(set(map(title_key, raw_titles)))
+        
+        # Built as a plain dict matching ScrapeResponse: every field comes from
+        # our own scraper/formatter, so Pydantic validation would be redundant.
+        content = {
+            "username": username,
+            "total_videos_scraped": len(raw_titles),
+            "total_unique_titles": unique_count,
+            "real_songs_identified": real_songs_count,
+            "raw_titles": raw_titles,
+            "processed_songs": processed_songs,
+            "message": f"Successfully scraped {unique_count} unique audio titles" + 
+                       (f" and identified {real_songs_count} real songs" if processed_songs else "")
+        }
+        response_cache.set(cache_key, content)
+        return ORJSONResponse(content)
         
     except Exception as e:
         raise HTTPException(
@@ -1,5 +1,6 @@
 """Services Package"""
-from .scraper import TikTokScraper
+from .scraper import BrowserPool, TikTokScraper, scrape_profiles
 from .processor import SongProcessor
+from .cache import SemanticCache
 
-__all__ = ["TikTokScraper", "SongProcessor"]
+__all__ = ["TikTokScraper", "BrowserPool", "scrape_profiles", "SongProcessor", "SemanticCache"]
@@ -0,0 +1,215 @@
+"""
+Semantic Cache Service
+
+This module contains the SemanticCache class that remembers Gemini song
+classifications so repeated or near-duplicate TikTok audio titles can be
+answered without another API call, and a small TTLCache for exact-match
+caching of whole responses.
+"""
+
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+import orjson
+
+
+# Numbers that tell otherwise identical titles apart ("Part 1" / "Part 2")
+NUMBER_PATTERN = re.compile(r"\d+")
+
+
+def default_cache_path() -> str:
+    """
+    SQLite file for the song cache: SONG_CACHE_PATH, else in the output
+    directory the CLI writes to (/app/output in Docker, ./output otherwise).
+    """
+    path = os.getenv("SONG_CACHE_PATH")
+    if path:
+        return path
+    output_dir = "/app/output" if os.path.isdir("/app/output") else "output"
+    os.makedirs(output_dir, exist_ok=True)
+    return os.path.join(output_dir, ".song_cache.sqlite")
+
+
+def title_key(title: str) -> str:
+    """Key used to detect duplicate titles: case- and whitespace-insensitive."""
+    return " ".join(title.lower().split())
+
+
+def embed_title(key: str, n: int = 3) -> dict[str, float]:
+    """
+    Embed a title key as an L2-normalized character n-gram vector.
+
+    Cheap and local, which is all we need to catch TikTok's near-duplicate
+    titles (extra punctuation, emoji, "(sped up)" suffixes, etc.).
+    """
+    padded = f" {key} "
+    grams = Counter(padded[i:i + n] for i in range(max(len(padded) - n + 1, 1)))
+    norm = math.sqrt(sum(c * c for c in grams.values())) or 1.0
+    return {g: c / norm for g, c in grams.items()}
+
+
+def cosine_similarity(a: dict[str, float], b: dict[str, float]) -> float:
+    """Cosine similarity of two normalized sparse vectors."""
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(g, 0.0) for g, v in a.items())
+
+
+class TTLCache:
+    """In-memory exact-match cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 256):
+        """
+        Initialize the cache.
+
+        Args:
+            ttl: Time-to-live for entries, in seconds.
+            max_entries: Oldest entries are evicted beyond this size.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: dict[str, tuple[object, float]] = {}
+
+    def get(self, key: str):
+        """Return the cached value for `key`, or None if missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            return None
+        return value
+
+    def set(self, key: str, value) -> None:
+        """Store `value` under `key`."""
+        self._entries.pop(key, None)
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        while len(self._entries) > self.max_entries:
+            del self._entries[next(iter(self._entries))]
+
+
+class SemanticCache:
+    """
+    Caches processed song results keyed by `title_key`.
+
+    Lookups try an exact match on the title key first, then fall back to the
+    most similar cached title above `threshold` with the same numbers in it,
+    so "Part 1" and "Part 2" of a series stay separate. Entries are
+    persisted in SQLite and expire after `ttl` seconds.
+
+    Fuzzy lookups only score the titles sharing the most trigrams with the
+    query (found through an inverted index), so a miss doesn't scan the whole
+    cache. Calls block on SQLite; async callers should run them in a thread.
+    """
+
+    # Most similar-looking titles scored per fuzzy lookup
+    MAX_CANDIDATES = 32
+
+    def __init__(self, path: str | None = None, threshold: float = 0.9, ttl: float = 7 * 24 * 3600):
+        """
+        Initialize the cache.
+
+        Args:
+            path: SQLite database path (defaults to `default_cache_path()`;
+                use ":memory:" for a per-process cache).
+            threshold: Minimum cosine similarity for a near-duplicate hit.
+            ttl: Time-to-live for entries, in seconds.
+        """
+        self.threshold = threshold
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path or default_cache_path(), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS song_cache ("
+            "key TEXT PRIMARY KEY, result TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._db.execute("DELETE FROM song_cache WHERE created_at < ?", (time.time() - ttl,))
+        self._db.commit()
+
+        self._entries: dict[str, tuple[dict, float]] = {}
+        self._vectors: dict[str, dict[str, float]] = {}
+        self._index: dict[str, set[str]] = {}
+        for key, result, created_at in self._db.execute("SELECT key, result, created_at FROM song_cache"):
+            self._add(key, orjson.loads(result), created_at)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _add(self, key: str, result: dict, created_at: float) -> None:
+        """Store an entry in memory and index its trigrams. Caller holds the lock."""
+        self._entries[key] = (result, created_at)
+        if key not in self._vectors:
+            vector = self._vectors[key] = embed_title(key)
+            for gram in vector:
+                self._index.setdefault(gram, set()).add(key)
+
+    def _expired(self, created_at: float) -> bool:
+        return time.time() - created_at > self.ttl
+
+    def get(self, title: str) -> dict | None:
+        """
+        Look up a cached result for a raw title.
+
+        Returns:
+            A copy of the cached result with `original_title` set to `title`,
+            or None on a miss.
+        """
+        key = title_key(title)
+        if not key:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[1]):
+                entry = self._nearest(key)
+        if entry is None:
+            return None
+        return {**entry[0], "original_title": title}
+
+    def _nearest(self, key: str) -> tuple[dict, float] | None:
+        """Most similar unexpired entry above the threshold. Caller holds the lock."""
+        vector = embed_title(key)
+        shared = Counter()
+        for gram in vector:
+            shared.update(self._index.get(gram, ()))
+
+        numbers = NUMBER_PATTERN.findall(key)
+        best, best_score = None, self.threshold
+        for other, _ in shared.most_common(self.MAX_CANDIDATES):
+            if other == key or NUMBER_PATTERN.findall(other) != numbers:
+                continue
+            entry = self._entries[other]
+            if self._expired(entry[1]):
+                continue
+            score = cosine_similarity(vector, self._vectors[other])
+            if score >= best_score:
+                best, best_score = entry, score
+        return best
+
+    def set(self, title: str, result: dict) -> None:
+        """Store a processed result for a raw title."""
+        self.set_many([(title, result)])
+
+    def set_many(self, items: list[tuple[str, dict]]) -> None:
+        """Store several processed results in one SQLite transaction."""
+        created_at = time.time()
+        rows = []
+        with self._lock:
+            for title, result in items:
+                key = title_key(title)
+                if not key:
+                    continue
+                self._add(key, result, created_at)
+                rows.append((key, orjson.dumps(result).decode(), created_at))
+            if rows:
+                with self._db:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO song_cache (key, result, created_at) VALUES (?, ?, ?)",
+                        rows,
+                    )
@@ -5,9 +5,105 @@ This module contains the SongProcessor class that uses Gemini AI
 to identify real songs from raw TikTok audio titles.
 """
 
+import asyncio
 import json
+import logging
+import re
+import orjson
 import time
+import httpx
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
 from google import genai
+from google.genai import errors, types
+from pydantic import BaseModel
+
+from .cache import SemanticCache, title_key
+from .ratelimit import TokenBucket
+from .storage import write_json_atomic
+
+
+log = logging.getLogger(__name__)
+
+
+# Static instructions shared by every batch, sent as the system instruction
+SYSTEM_PROMPT = """Analyze the TikTok audio titles you are given and identify which ones are real songs (not user-created original sounds).
+
+For each title, determine:
+1. Is it a real song? (not "original sound" by a random user)
+2. If it's a real song, provide the correct song name and artist
+3. If the title contains lyrics, try to identify the actual song
+4. Note if it's a remix, cover, or mashup
+
+Respond in JSON format as a list of objects:
+[
+  {
+    "original_title": "the original title",
+    "is_real_song": true/false,
+    "song_name": "Actual Song Name" or null,
+    "artist": "Artist Name" or null,
+    "is_remix": true/false,
+    "is_cover": true/false,
+    "confidence": "high/medium/low",
+    "notes": "any relevant notes"
+  }
+]
+
+Important rules:
+- "original sound - [username]" entries are NOT real songs (is_real_song: false)
+- Songs with real artist names in the title ARE real songs
+- If you recognize lyrics, identify the actual song
+- Be moderate - if unsure, set confidence to "low", but make a best effort to identify real songs even from vague titles
+- Return ONLY valid JSON, no other text"""
+
+
+# Markdown code fences Gemini sometimes wraps JSON in, despite the mime type
+CODE_FENCE_PATTERN = re.compile(r"^```(?:json)?\s*|\s*```\s*$", re.MULTILINE)
+
+
+# Per-batch message; only the numbered titles change between calls
+BATCH_PROMPT_TEMPLATE = "TikTok Audio Titles:\n{titles_text}"
+
+
+class SongEntry(BaseModel):
+    """Schema Gemini must follow for each classified title."""
+    original_title: str
+    is_real_song: bool
+    song_name: Optional[str] = None
+    artist: Optional[str] = None
+    is_remix: bool = False
+    is_cover: bool = False
+    confidence: str = "low"
+    notes: Optional[str] = None
+
+
+# Per-call config. The prompt is sent inline: at a few hundred tokens it is
+# below Gemini's minimum size for explicit context caching.
+GENERATION_CONFIG = types.GenerateContentConfig(
+    system_instruction=SYSTEM_PROMPT,
+    response_mime_type="application/json",
+    response_schema=list[SongEntry],
+)
+
+
+# Failures that may depend on which titles are in the batch (a response
+# that can't be parsed or validated, a server error, a timeout), so retrying
+# the batch in smaller pieces can help
+SPLITTABLE_ERRORS = (ValueError, errors.ServerError, TimeoutError, httpx.TransportError)
+
+
+class CallBudget:
+    """Gemini calls left for one batch, shared by all of its retries and halves."""
+    
+    def __init__(self, calls: int):
+        self.calls = calls
+    
+    def take(self) -> bool:
+        """Use up one call; False once the budget is spent."""
+        if self.calls <= 0:
+            return False
+        self.calls -= 1
+        return True
 
 
 class SongProcessor:
@@ -15,110 +111,343 @@ class SongProcessor:
     Uses Gemini AI to process raw TikTok audio titles and identify real songs.
     """
     
-    def __init__(self, api_key: str, model_name: str = 'gemini-2.0-flash'):
+    RATE_LIMIT_RETRIES = 5
+    RATE_LIMIT_BURST = 5
+    
+    def __init__(
+        self,
+        api_key: str,
+        model_name: str = 'gemini-2.0-flash',
+        cache: SemanticCache | None = None,
+        requests_per_minute: int = 60,
+        rate_limiter: TokenBucket | None = None
+    ):
         """
         Initialize the processor with a Gemini API key.
         
         Args:
             api_key: Gemini API key.
             model_name: The Gemini model to use.
+            cache: Cache of previously processed titles (the on-disk default if omitted).
+            requests_per_minute: Gemini request quota used to pace batches.
+            rate_limiter: Limiter shared with other processors (e.g. one per
+                server process); overrides `requests_per_minute`.
         """
         self.client = genai.Client(api_key=api_key)
         self.model_name = model_name
+        self.cache = cache if cache is not None else SemanticCache()
+        self.rate_limiter = rate_limiter or self.make_rate_limiter(requests_per_minute)
+        
+    @classmethod
+    def make_rate_limiter(cls, requests_per_minute: int) -> TokenBucket:
+        """Build a limiter pacing Gemini calls to `requests_per_minute` (at least 1)."""
+        return TokenBucket(rate=max(1, requests_per_minute) / 60, capacity=cls.RATE_LIMIT_BURST)
         
-    def process_songs(self, raw_titles: list[str], batch_size: int = 20) -> list[dict]:
+    def process_songs(self, raw_titles: list[str], batch_size: int = 20, max_workers: int = 4) -> list[dict]:
         """
         Process a list of raw TikTok audio titles to identify real songs.
         
         Args:
             raw_titles: List of raw audio titles from TikTok.
             batch_size: Number of titles to process per API call.
+            max_workers: Number of batches sent to Gemini concurrently.
             
         Returns:
             List of identified songs with their details.
         """
-        all_results = []
+        resolved, pending = self._resolve_cached(raw_titles)
+        batches = self._make_batches(pending, batch_size)
         
-        for i in range(0, len(raw_titles), batch_size):
-            batch = raw_titles[i:i + batch_size]
-            batch_num = (i // batch_size) + 1
-            total_batches = (len(raw_titles) + batch_size - 1) // batch_size
-            
-            print(f"\nProcessing batch {batch_num}/{total_batches} ({len(batch)} titles)...")
+        def run(batch_num: int, batch: list[str]) -> None:
+            log.info("Processing batch %d/%d (%d titles)...", batch_num, len(batches), len(batch))
+            self._run_batch(batch, resolved)
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(run, n, b) for n, b in enumerate(batches, 1)]
+            for future in as_completed(futures):
+                future.result()
+        
+        return self._expand_results(raw_titles, resolved)
+    
+    async def aprocess_songs(self, raw_titles: list[str], batch_size: int = 20, max_concurrency: int = 5) -> list[dict]:
+        """
+        Async version of `process_songs` that sends batches concurrently.
+        
+        Args:
+            raw_titles: List of raw audio titles from TikTok.
+            batch_size: Number of titles to process per API call.
+            max_concurrency: Maximum number of in-flight Gemini requests.
             
-            try:
-                results = self._process_batch(batch)
-                all_results.extend(results)
-                real_count = len([r for r in results if r.get('is_real_song')])
-                print(f"  Found {real_count} real songs in this batch.")
-                
-                if i + batch_size < len(raw_titles):
-                    time.sleep(1)
-                    
-            except Exception as e:
-                print(f"  Error processing batch: {e}")
-                for title in batch:
-                    all_results.append({
-                        "original_title": title,
-                        "is_real_song": None,
-                        "error": str(e)
-                    })
+        Returns:
+            List of identified songs with their details.
+        """
+        # Cache lookups and writes hit SQLite, so keep them off the event loop
+        resolved, pending = await asyncio.to_thread(self._resolve_cached, raw_titles)
+        batches = self._make_batches(pending, batch_size)
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def run(batch_num: int, batch: list[str]) -> None:
+            log.info("Processing batch %d/%d (%d titles)...", batch_num, len(batches), len(batch))
+            await self._arun_batch(batch, resolved, semaphore)
         
+        await asyncio.gather(*(run(n, b) for n, b in enumerate(batches, 1)))
+        return self._expand_results(raw_titles, resolved)
+    
+    def _run_batch(
+        self,
+        batch: list[str],
+        resolved: dict[str, dict],
+        attempt: int = 1,
+        budget: CallBudget | None = None
+    ) -> None:
+        """
+        Process a batch, splitting it in half and retrying on failure.
+        
+        Errors that may depend on the batch's contents (unparseable
+        responses, 5xx, timeouts) are retried in halves, so only the
+        sub-batch that keeps failing is marked as errored. Rate-limit errors
+        back off and retry the batch as-is, until the retries run out. Other
+        client errors (bad key, invalid request) fail the batch at once,
+        since retrying can't fix them. All of a batch's retries draw on one
+        budget of Gemini calls.
+        """
+        if budget is None:
+            budget = self._call_budget(batch)
+        if not budget.take():
+            self._store_error(batch, RuntimeError("Gave up after too many retries"), resolved)
+            return
+        try:
+            self.rate_limiter.wait()
+            results = self._process_batch(batch)
+        except Exception as e:
+            action = self._retry_action(e, attempt, len(batch))
+            if action == "retry":
+                delay = self._retry_delay(attempt)
+                log.warning("Rate limited by Gemini, retrying in %.0fs...", delay)
+                time.sleep(delay)
+                self._run_batch(batch, resolved, attempt + 1, budget)
+            elif action == "split":
+                log.warning("Batch of %d failed (%s), retrying in halves...", len(batch), e)
+                time.sleep(self._retry_delay(attempt))
+                mid = len(batch) // 2
+                self._run_batch(batch[:mid], resolved, attempt + 1, budget)
+                self._run_batch(batch[mid:], resolved, attempt + 1, budget)
+            else:
+                self._store_error(batch, e, resolved)
+            return
+        self._store_results(batch, results, resolved)
+    
+    async def _arun_batch(
+        self,
+        batch: list[str],
+        resolved: dict[str, dict],
+        semaphore: asyncio.Semaphore,
+        attempt: int = 1,
+        budget: CallBudget | None = None
+    ) -> None:
+        """Async version of `_run_batch`; both halves are retried concurrently."""
+        if budget is None:
+            budget = self._call_budget(batch)
+        if not budget.take():
+            self._store_error(batch, RuntimeError("Gave up after too many retries"), resolved)
+            return
+        try:
+            async with semaphore:
+                await self.rate_limiter.acquire()
+                results = await self._aprocess_batch(batch)
+        except Exception as e:
+            action = self._retry_action(e, attempt, len(batch))
+            if action == "retry":
+                delay = self._retry_delay(attempt)
+                log.warning("Rate limited by Gemini, retrying in %.0fs...", delay)
+                await asyncio.sleep(delay)
+                await self._arun_batch(batch, resolved, semaphore, attempt + 1, budget)
+            elif action == "split":
+                log.warning("Batch of %d failed (%s), retrying in halves...", len(batch), e)
+                await asyncio.sleep(self._retry_delay(attempt))
+                mid = len(batch) // 2
+                await asyncio.gather(
+                    self._arun_batch(batch[:mid], resolved, semaphore, attempt + 1, budget),
+                    self._arun_batch(batch[mid:], resolved, semaphore, attempt + 1, budget)
+                )
+            else:
+                self._store_error(batch, e, resolved)
+            return
+        await asyncio.to_thread(self._store_results, batch, results, resolved)
+    
+    def _call_budget(self, batch: list[str]) -> CallBudget:
+        """Enough calls to halve `batch` down to single titles, plus the rate-limit retries."""
+        return CallBudget(2 * len(batch) - 1 + self.RATE_LIMIT_RETRIES)
+    
+    def _retry_action(self, error: Exception, attempt: int, batch_size: int) -> str:
+        """
+        How to handle a failed Gemini call.
+        
+        Returns "retry" to back off and resend the same batch, "split" to
+        retry it in halves, or "fail" to mark it as errored.
+        """
+        code = getattr(error, "code", None)
+        if code == 429:
+            return "retry" if attempt <= self.RATE_LIMIT_RETRIES else "fail"
+        if batch_size > 1 and isinstance(error, SPLITTABLE_ERRORS):
+            return "split"
+        return "fail"
+    
+    @staticmethod
+    def _retry_delay(attempt: int) -> float:
+        """Exponential backoff between retries: 1s, 2s, 4s, ... capped at 10s."""
+        return min(10.0, 2.0 ** (attempt - 1))
+    
+    def _resolve_cached(self, raw_titles: list[str]) -> tuple[dict[str, dict], list[str]]:
+        """
+        Deduplicate titles and answer what we can from the cache.
+        
+        Returns:
+            (resolved results keyed by title key, unique titles still to process)
+        """
+        unique: dict[str, str] = {}
+        for title in raw_titles:
+            unique.setdefault(title_key(title), title)
+        
+        resolved: dict[str, dict] = {}
+        pending = []
+        
+        for key, title in unique.items():
+            cached = self.cache.get(title)
+            if cached is not None:
+                resolved[key] = cached
+            else:
+                pending.append(title)
+        
+        if len(unique) < len(raw_titles):
+            log.info("Collapsed %d titles into %d unique titles.", len(raw_titles), len(unique))
+        if resolved:
+            log.info("Found %d titles in cache, %d left to process.", len(resolved), len(pending))
+        
+        return resolved, pending
+    
+    @staticmethod
+    def _make_batches(titles: list[str], batch_size: int) -> list[list[str]]:
+        """Split titles into API-sized batches."""
+        return [titles[i:i + batch_size] for i in range(0, len(titles), batch_size)]
+    
+    def _store_results(self, batch: list[str], results: list[dict], resolved: dict[str, dict]) -> None:
+        """Record a batch's results and write confirmed ones to the cache."""
+        confirmed = []
+        for title, r in self._pair_results(batch, results):
+            resolved[title_key(title)] = r
+            if r.get('is_real_song') is not None:
+                confirmed.append((title, r))
+        self.cache.set_many(confirmed)
+        real_count = len([r for r in results if r.get('is_real_song')])
+        log.info("Found %d real songs in this batch.", real_count)
+    
+    def _store_error(self, batch: list[str], error: Exception, resolved: dict[str, dict]) -> None:
+        """Record a failed batch so its titles still appear in the output."""
+        log.error("Error processing batch: %s", error)
+        for title in batch:
+            resolved[title_key(title)] = {
+                "original_title": title,
+                "is_real_song": None,
+                "error": str(error)
+            }
+    
+    def _expand_results(self, raw_titles: list[str], resolved: dict[str, dict]) -> list[dict]:
+        """Fan resolved results back out to the original title order."""
+        all_results = []
+        for title in raw_titles:
+            r = resolved.get(title_key(title))
+            if r is not None:
+                all_results.append({**r, "original_title": title})
         return all_results
     
+    def _pair_results(self, titles: list[str], results: list[dict]) -> list[tuple[str, dict]]:
+        """
+        Match Gemini results back to the titles that were sent.
+        
+        Results are matched on the echoed `original_title`; any Gemini tidied
+        up are paired in order with the titles left over.
+        """
+        remaining = {title_key(t): t for t in titles}
+        paired = []
+        unmatched = []
+        
+        for r in results:
+            title = remaining.pop(title_key(r.get("original_title") or ""), None)
+            if title is None:
+                unmatched.append(r)
+            else:
+                paired.append((title, r))
+        
+        paired.extend(zip(remaining.values(), unmatched))
+        return paired
+    
     def _process_batch(self, titles: list[str]) -> list[dict]:
         """Process a batch of titles using Gemini."""
-        titles_text = "\n".join([f"{i+1}. {title}" for i, title in enumerate(titles)])
-        
-        prompt = f"""Analyze these TikTok audio titles and identify which ones are real songs (not user-created original sounds).
-
-For each title, determine:
-1. Is it a real song? (not "original sound" by a random user)
-2. If it's a real song, provide the correct song name and artist
-3. If the title contains lyrics, try to identify the actual song
-4. Note if it's a remix, cover, or mashup
-
-TikTok Audio Titles:
-{titles_text}
-
-Respond in JSON format as a list of objects:
-[
-  {{
-    "original_title": "the original title",
-    "is_real_song": true/false,
-    "song_name": "Actual Song Name" or null,
-    "artist": "Artist Name" or null,
-    "is_remix": true/false,
-    "is_cover": true/false,
-    "confidence": "high/medium/low",
-    "notes": "any relevant notes"
-  }}
-]
-
-Important rules:
-- "original sound - [username]" entries are NOT real songs (is_real_song: false)
-- Songs with real artist names in the title ARE real songs
-- If you recognize lyrics, identify the actual song
-- Be moderate - if unsure, set confidence to "low", but make a best effort to identify real songs even from vague titles
-- Return ONLY valid JSON, no other text"""
-
         response = self.client.models.generate_content(
             model=self.model_name,
-            contents=prompt
+            contents=self._batch_contents(titles),
+            config=GENERATION_CONFIG
+        )
+        return self._parse_response(response.text, titles)
+    
+    async def _aprocess_batch(self, titles: list[str]) -> list[dict]:
+        """Process a batch of titles using Gemini's async client."""
+        response = await self.client.aio.models.generate_content(
+            model=self.model_name,
+            contents=self._batch_contents(titles),
+            config=GENERATION_CONFIG
         )
-        response_text = response.text.strip()
+        return self._parse_response(response.text, titles)
+    
+    @staticmethod
+    def _batch_contents(titles: list[str]) -> str:
+        """Build the per-batch message listing the titles."""
+        titles_text = "\n".join(f"{i}. {title}" for i, title in enumerate(titles, 1))
+        return BATCH_PROMPT_TEMPLATE.format(titles_text=titles_text)
+    
+    def _parse_response(self, response_text: str, titles: list[str]) -> list[dict]:
+        """
+        Parse Gemini's JSON answer for a batch.
         
-        if response_text.startswith("```"):
-            lines = response_text.split("\n")
-            response_text = "\n".join(lines[1:-1])
+        Responses are schema-constrained JSON, so this is normally a single
+        `orjson.loads` (after dropping any stray code fences). If that fails
+        (e.g. a truncated response), salvage every complete object so one bad
+        entry doesn't discard the whole batch.
+        """
+        response_text = CODE_FENCE_PATTERN.sub("", response_text).strip()
         
         try:
-            results = json.loads(response_text)
-            return results
+            results = orjson.loads(response_text)
+            if isinstance(results, list):
+                return results
         except json.JSONDecodeError as e:
-            print(f"  Warning: Could not parse JSON response: {e}")
-            print(f"  Response was: {response_text[:500]}...")
-            return [{"original_title": t, "is_real_song": None, "parse_error": True} for t in titles]
+            log.warning("Could not parse JSON response: %s", e)
+        
+        results = self._salvage_objects(response_text)
+        if results:
+            log.warning("Recovered %d/%d entries from malformed response.", len(results), len(titles))
+            return results
+        
+        log.warning("Response was: %s...", response_text[:500])
+        return [{"original_title": t, "is_real_song": None, "parse_error": True} for t in titles]
+    
+    @staticmethod
+    def _salvage_objects(text: str) -> list[dict]:
+        """Decode every well-formed JSON object found in `text`."""
+        decoder = json.JSONDecoder()
+        results = []
+        pos = text.find("{")
+        while pos != -1:
+            try:
+                obj, end = decoder.raw_decode(text, pos)
+            except json.JSONDecodeError:
+                pos = text.find("{", pos + 1)
+                continue
+            if isinstance(obj, dict) and obj.get("original_title"):
+                results.append(obj)
+            pos = text.find("{", end)
+        return results
     
     def get_real_songs_only(self, processed_results: list[dict]) -> list[dict]:
         """Filter processed results to only include confirmed real songs."""
@@ -129,47 +458,35 @@ Important rules:
     
     def format_song_list(self, processed_results: list[dict], include_originals: bool = False) -> list[dict]:
         """Format the processed results into a clean song list."""
-        formatted = []
-        
-        for r in processed_results:
-            if r.get("is_real_song"):
-                entry = {
-                    "song": r.get("song_name", r.get("original_title")),
-                    "artist": r.get("artist", "Unknown"),
-                }
-                if r.get("is_remix"):
-                    entry["type"] = "remix"
-                elif r.get("is_cover"):
-                    entry["type"] = "cover"
-                else:
-                    entry["type"] = "original"
-                    
-                entry["confidence"] = r.get("confidence", "unknown")
-                entry["tiktok_title"] = r.get("original_title")
-                formatted.append(entry)
-                
-            elif include_originals:
-                formatted.append({
-                    "song": None,
-                    "artist": None,
-                    "type": "user_original",
-                    "tiktok_title": r.get("original_title")
-                })
-        
-        return formatted
+        return [
+            {
+                "song": r.get("song_name", r.get("original_title")),
+                "artist": r.get("artist", "Unknown"),
+                "type": "remix" if r.get("is_remix") else "cover" if r.get("is_cover") else "original",
+                "confidence": r.get("confidence", "unknown"),
+                "tiktok_title": r.get("original_title"),
+            }
+            if r.get("is_real_song") else
+            {
+                "song": None,
+                "artist": None,
+                "type": "user_original",
+                "tiktok_title": r.get("original_title")
+            }
+            for r in processed_results
+            if include_originals or r.get("is_real_song")
+        ]
 
     def save_results(self, processed_results: list[dict], filename: str = "processed_songs.json") -> None:
         """Save processed results to a JSON file."""
-        print(f"Saving processed results to {filename}...")
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(processed_results, f, ensure_ascii=False, indent=4)
-        print("Done.")
+        log.info("Saving processed results to %s...", filename)
+        write_json_atomic(filename, processed_results)
+        log.info("Done.")
 
     def save_formatted_songs(self, processed_results: list[dict], filename: str = "songs.json") -> list[dict]:
         """Save formatted real songs to a JSON file."""
         real_songs = self.format_song_list(processed_results)
-        print(f"Saving {len(real_songs)} identified real songs to {filename}...")
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(real_songs, f, ensure_ascii=False, indent=4)
-        print("Done.")
+        log.info("Saving %d identified real songs to %s...", len(real_songs), filename)
+        write_json_atomic(filename, real_songs)
+        log.info("Done.")
         return real_songs
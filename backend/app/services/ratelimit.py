@@ -0,0 +1,56 @@
+"""
+Rate Limiting Utilities
+
+This module contains a small token-bucket limiter used to keep concurrent
+Gemini calls within the API's request quota.
+"""
+
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter.
+
+    Allows bursts of up to `capacity` calls, refilling at `rate` tokens per
+    second. Callers only wait when the bucket is empty.
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        """
+        Initialize the limiter.
+
+        Args:
+            rate: Tokens added per second.
+            capacity: Maximum number of tokens (burst size).
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self) -> float:
+        """Take a token if available; otherwise return seconds until one is."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def wait(self) -> None:
+        """Block until a call is allowed."""
+        while (delay := self._take()) > 0:
+            time.sleep(delay)
+
+    async def acquire(self) -> None:
+        """Wait (without blocking the event loop) until a call is allowed."""
+        while (delay := self._take()) > 0:
+            await asyncio.sleep(delay)
@@ -6,11 +6,21 @@ from a TikTok user's profile using Playwright with stealth capabilities.
 """
 
 import os
+import re
 import time
 import random
-import json
-from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeout
+import logging
+import asyncio
+import weakref
+from urllib.parse import urlsplit
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeout
 from playwright_stealth import Stealth
+import orjson
+
+from .storage import write_json_atomic
+
+
+log = logging.getLogger(__name__)
 
 
 class TikTokScraper:
@@ -28,248 +38,703 @@ class TikTokScraper:
         'div[class*="MusicText"]',
     ]
     
-    def __init__(self, username: str):
+    # All of the above as one selector list, matched in a single DOM traversal
+    COMBINED_MUSIC_SELECTOR = ", ".join(MUSIC_SELECTORS)
+    
+    # Returns the first visible, non-empty music title, so the whole probe is
+    # a single round-trip.
+    MUSIC_TITLE_JS = """(selector) => {
+        for (const el of document.querySelectorAll(selector)) {
+            const rect = el.getBoundingClientRect();
+            if (rect.width === 0 && rect.height === 0) continue;
+            const text = (el.innerText || '').trim();
+            if (text) return text;
+        }
+        return null;
+    }"""
+    
+    # Chromium flags and context settings shared by every scrape
+    BROWSER_ARGS = (
+        '--disable-blink-features=AutomationControlled',
+        '--disable-infobars',
+        '--disable-dev-shm-usage',
+        '--disable-browser-side-navigation',
+        '--no-sandbox',
+        '--disable-setuid-sandbox',
+        '--disable-web-security',
+        '--disable-features=IsolateOrigins,site-per-process',
+        '--disable-site-isolation-trials',
+        '--disable-features=BlockInsecurePrivateNetworkRequests',
+        '--window-size=1920,1080',
+        # Nothing is ever looked at or listened to, so skip decoding it
+        '--blink-settings=imagesEnabled=false',
+        '--mute-audio',
+        # Background work a throwaway scraping profile never needs
+        '--disable-background-networking',
+        '--disable-background-timer-throttling',
+        '--disable-default-apps',
+        '--disable-sync',
+        '--disable-translate',
+        '--disable-client-side-phishing-detection',
+        '--metrics-recording-only',
+        '--no-first-run',
+    )
+    
+    HEADLESS_BROWSER_ARGS = (
+        '--headless=new',
+        '--disable-extensions',
+    )
+    
+    CONTEXT_OPTIONS = {
+        'viewport': {'width': 1920, 'height': 1080},
+        'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
+        'locale': 'en-US',
+        'timezone_id': 'America/Los_Angeles',
+        'geolocation': {'latitude': 34.0522, 'longitude': -118.2437},
+        'permissions': ['geolocation'],
+        'color_scheme': 'light',
+        'java_script_enabled': True,
+        'has_touch': False,
+        'is_mobile': False,
+        'extra_http_headers': {
+            'Accept-Language': 'en-US,en;q=0.9',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+            'Accept-Encoding': 'gzip, deflate, br',
+            'Upgrade-Insecure-Requests': '1',
+        },
+    }
+    
+    # Requests we never need: only DOM text is read, never pixels, styling or sound
+    BLOCKED_RESOURCE_TYPES = frozenset({'image', 'media', 'font', 'stylesheet'})
+    BLOCKED_HOSTS = frozenset({
+        'analytics.tiktok.com',
+        'mon.tiktokv.com',
+        'mon-va.byteoversea.com',
+        'mcs.tiktokv.com',
+        'www.google-analytics.com',
+        'www.googletagmanager.com',
+    })
+    
+    # Links to individual videos in the profile grid
+    VIDEO_LINK_SELECTOR = 'div[data-e2e="user-post-item"] a[href*="/video/"]'
+    VIDEO_URLS_JS = "els => [...new Set(els.map(e => e.href))]"
+    # Counts unique hrefs like VIDEO_URLS_JS, so grid items with several
+    # links to the same video don't look like new videos
+    MORE_VIDEO_URLS_JS = """([selector, count]) =>
+        new Set([...document.querySelectorAll(selector)].map(e => e.href)).size > count"""
+    
+    # Video pages fetched at once when scraping by URL
+    VIDEO_CONCURRENCY = 5
+    
+    # XHRs that carry a video's metadata, including its music title
+    ITEM_DETAIL_PATHS = ('/api/item/detail/', '/aweme/v1/aweme/detail')
+    DETAIL_RESPONSE_TIMEOUT = 5
+    
+    # Item-detail API queried directly over HTTP before falling back to a page
+    ITEM_DETAIL_API = 'https://www.tiktok.com/api/item/detail/'
+    VIDEO_ID_PATTERN = re.compile(r'/video/(\d+)')
+    API_CONCURRENCY = 20
+    
+    # New titles between checkpoint writes
+    CHECKPOINT_EVERY = 50
+    
+    # Session cookies/localStorage kept between runs to skip TikTok's cold handshake
+    STORAGE_STATE_FILE = 'storage_state.json'
+    
+    # Stealth evasions, rendered once and installed as a context init script
+    STEALTH_SCRIPT = Stealth().script_payload
+    
+    # Default browser pools for scrapes that aren't given one, per event loop
+    _shared_pools = weakref.WeakKeyDictionary()
+    
+    def __init__(self, username: str, checkpoint_path: str | None = None):
         """
         Initialize the scraper with a TikTok username.
         
         Args:
             username: The TikTok username to scrape.
+            checkpoint_path: If set, songs found so far are written here every
+                CHECKPOINT_EVERY new titles, so a crash loses little work.
         """
         self.username = username
         self.url = f"https://www.tiktok.com/@{self.username}"
-        self.songs: list[str] = []
+        # Unique titles in discovery order (dict keys double as an ordered set)
+        self._songs: dict[str, None] = {}
         self.headless = os.getenv('HEADLESS', 'false').lower() == 'true'
         self.output_dir = "/app/output" if os.path.isdir("/app/output") else "."
+        # Save screenshots/HTML when a scrape fails (costly on TikTok's huge DOM)
+        self.debug = os.getenv('SCRAPER_DEBUG') == '1'
+        # Wall-clock budget for fetching a profile's videos
+        self.max_seconds = float(os.getenv('SCRAPER_MAX_SECONDS', '900'))
+        self.checkpoint_path = checkpoint_path
+        self._checkpointed_count = 0
+
+    @property
+    def songs(self) -> list[str]:
+        """Unique song titles found so far, in the order they were found."""
+        return list(self._songs)
 
     def _get_screenshot_path(self, filename: str) -> str:
         """Get the appropriate path for saving screenshots."""
         return os.path.join(self.output_dir, filename)
 
-    def _setup_browser(self, playwright):
-        """Sets up a browser with stealth settings to avoid bot detection."""
-        if self.headless:
-            print("Running in headless mode (Docker/CI environment)")
-        
-        browser_args = [
-            '--disable-blink-features=AutomationControlled',
-            '--disable-infobars',
-            '--disable-dev-shm-usage',
-            '--disable-browser-side-navigation',
-            '--disable-gpu',
-            '--no-sandbox',
-            '--disable-setuid-sandbox',
-            '--disable-web-security',
-            '--disable-features=IsolateOrigins,site-per-process',
-            '--disable-site-isolation-trials',
-            '--disable-features=BlockInsecurePrivateNetworkRequests',
-            '--window-size=1920,1080',
-        ]
-        
-        if self.headless:
-            browser_args.extend([
-                '--headless=new',
-                '--disable-extensions',
-            ])
+    @classmethod
+    def get_pool(cls, headless: bool, storage_state_path: str | None = None) -> "BrowserPool":
+        """
+        Get the running event loop's default browser pool, creating it on first use.
         
-        browser = playwright.chromium.launch(
-            headless=self.headless,
-            args=browser_args
-        )
+        The pool launches its browser lazily, on the first acquire.
+        """
+        pools = cls._shared_pools.setdefault(asyncio.get_running_loop(), {})
+        if headless not in pools:
+            pools[headless] = BrowserPool(headless=headless, storage_state_path=storage_state_path)
+        return pools[headless]
+    
+    @classmethod
+    async def shutdown(cls) -> None:
+        """Close the running event loop's default browser pools, if any."""
+        pools = cls._shared_pools.pop(asyncio.get_running_loop(), {})
+        for pool in pools.values():
+            await pool.close()
+    
+    @classmethod
+    async def _launch_browser(cls, playwright, headless: bool):
+        """Launch Chromium with the scraper's flags."""
+        if headless:
+            log.info("Running in headless mode (Docker/CI environment)")
         
-        context = browser.new_context(
-            viewport={'width': 1920, 'height': 1080},
-            user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
-            locale='en-US',
-            timezone_id='America/Los_Angeles',
-            geolocation={'latitude': 34.0522, 'longitude': -118.2437},
-            permissions=['geolocation'],
-            color_scheme='light',
-            java_script_enabled=True,
-            has_touch=False,
-            is_mobile=False,
-            extra_http_headers={
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Upgrade-Insecure-Requests': '1',
-            }
-        )
+        browser_args = list(cls.BROWSER_ARGS)
+        if headless:
+            browser_args.extend(cls.HEADLESS_BROWSER_ARGS)
         
-        page = context.new_page()
-        Stealth().apply_stealth_sync(page)
+        return await playwright.chromium.launch(headless=headless, args=browser_args)
+    
+    @classmethod
+    async def _new_context(cls, browser, storage_state: dict | None = None):
+        """
+        Open a context with the scraper's fingerprint, request blocking and
+        stealth settings. Pages opened in it inherit all three.
         
-        return browser, context, page
+        Args:
+            browser: Browser to open the context in.
+            storage_state: Saved cookies/localStorage to start from.
+        """
+        context = await browser.new_context(**cls.CONTEXT_OPTIONS, storage_state=storage_state)
+        await context.route("**/*", cls._block_unneeded_requests)
+        await context.add_init_script(cls.STEALTH_SCRIPT)
+        return context
+
+    @classmethod
+    async def _block_unneeded_requests(cls, route) -> None:
+        """Abort images, media, fonts, stylesheets and trackers; let everything else through."""
+        request = route.request
+        if (request.resource_type in cls.BLOCKED_RESOURCE_TYPES
+                or urlsplit(request.url).hostname in cls.BLOCKED_HOSTS):
+            await route.abort()
+        else:
+            await route.continue_()
 
-    def _try_load_page(self, page, max_retries: int = 3) -> bool:
+    async def _try_load_page(self, page, max_retries: int = 3) -> bool:
         """Try to load the TikTok page with retries."""
         for attempt in range(1, max_retries + 1):
-            print(f"Attempt {attempt}/{max_retries} to load page...")
+            log.info("Attempt %d/%d to load page...", attempt, max_retries)
             
             try:
-                page.goto(self.url, wait_until='networkidle', timeout=60000)
-                time.sleep(random.uniform(2, 3))  # Initial page load delay
+                # Cheap HTTP probe first: if TikTok is rate limiting or down,
+                # back off without paying for a full render.
+                probe = await page.request.get(self.url, timeout=10000)
+                status = probe.status
+                await probe.dispose()
                 
+                if status in (429, 503):
+                    log.warning("TikTok responded with HTTP %d.", status)
+                else:
+                    # TikTok's analytics/ads long-polls never let the network go
+                    # idle, so return once navigation commits and treat the
+                    # video grid as the real readiness signal.
+                    await page.goto(self.url, wait_until='commit', timeout=30000)
+                    
+                    try:
+                        await page.wait_for_selector('div[data-e2e="user-post-item"]', timeout=20000)
+                        log.info("Page loaded successfully! Found video grid.")
+                        return True
+                    except Exception:
+                        pass
+                    
+                    # Checked in the page so the multi-MB DOM never crosses CDP
+                    if await page.evaluate("() => document.body.innerText.includes('Something went wrong')"):
+                        log.warning("TikTok showed error page.")
+                    else:
+                        log.warning("Video grid not found, but no error message detected.")
+                    
+            except Exception as e:
+                log.warning("Error during attempt %d: %s", attempt, e)
+            
+            log.warning("Attempt %d failed.", attempt)
+            
+            if attempt < max_retries:
+                # Start the next attempt without whatever session cookies
+                # got this one flagged. Only this context is affected; the
+                # pool's saved session is replaced only after a successful load.
                 try:
-                    page.wait_for_selector('div[data-e2e="user-post-item"]', timeout=15000)
-                    print("Page loaded successfully! Found video grid.")
-                    return True
+                    await page.context.clear_cookies()
                 except Exception:
                     pass
                 
-                content = page.content()
-                if "Something went wrong" in content:
-                    print("TikTok showed error page.")
-                else:
-                    print("Video grid not found, but no error message detected.")
-                
-                print(f"Attempt {attempt} failed.")
-                
-                if attempt < max_retries:
-                    wait_time = attempt * 5
-                    print(f"Waiting {wait_time} seconds before retry...")
-                    time.sleep(wait_time)
-                    
-            except Exception as e:
-                print(f"Error during attempt {attempt}: {e}")
-                if attempt < max_retries:
-                    time.sleep(5)
+                # Exponential backoff with jitter, so concurrent scrapes that
+                # failed together don't all retry together
+                wait_time = min(30, random.uniform(1, 2 ** attempt))
+                log.info("Waiting %.1f seconds before retry...", wait_time)
+                await asyncio.sleep(wait_time)
         
         return False
 
-    def _get_music_title(self, page) -> str | None:
+    async def _get_music_title(self, page) -> str | None:
         """Get the music/audio title. Returns immediately if found."""
-        for selector in self.MUSIC_SELECTORS:
-            try:
-                element = page.locator(selector).first
-                if element.is_visible():
-                    title = element.inner_text(timeout=200)
-                    if title and title.strip():
-                        return title.strip()
-            except Exception:
-                continue
-        return None
+        try:
+            return await page.evaluate(self.MUSIC_TITLE_JS, self.COMBINED_MUSIC_SELECTOR)
+        except Exception:
+            return None
 
-    def _click_next_and_wait_for_change(self, page, current_title: str | None) -> tuple[bool, str | None]:
-        """
-        Click next and wait for content to change. Returns (success, new_title).
-        Waits up to 2 seconds for the title to change, otherwise proceeds.
+    def scrape_songs(self, max_videos: int = 1000) -> list[str]:
         """
-        next_button = page.locator('button[data-e2e="arrow-right"]')
+        Synchronous wrapper around `scrape_songs_async` for scripts.
+        Launches a browser for this call and closes it afterwards.
         
-        try:
-            # Wait for next button to appear (up to 5 seconds)
-            # This handles slow loading / transition between videos
-            for i in range(50):
-                if next_button.is_visible():
-                    break
-                time.sleep(0.1)
-            else:
-                print("Next button not visible after 5 seconds. Reached the end.")
-                return False, None
-            
-            # Check if disabled (last video)
-            if next_button.get_attribute('disabled') is not None:
-                print("Next button is disabled. Reached the last video.")
-                return False, None
-            
-            # Click next
-            next_button.click()
-            
-            # Wait for title to change (max 2 seconds, check every 100ms)
-            for _ in range(20):
-                new_title = self._get_music_title(page)
-                if new_title and new_title != current_title:
-                    return True, new_title
-                time.sleep(0.1)
-            
-            # Title didn't change, but still continue
-            return True, self._get_music_title(page)
+        Args:
+            max_videos: Maximum number of videos to scrape (safety limit).
             
-        except Exception as e:
-            print(f"Error navigating: {e}")
-            return False, None
+        Returns:
+            List of unique song titles found.
+        """
+        async def run() -> list[str]:
+            try:
+                return await self.scrape_songs_async(max_videos)
+            finally:
+                await self.shutdown()
+        
+        return asyncio.run(run())
 
-    def scrape_songs(self, max_videos: int = 1000) -> list[str]:
+    async def scrape_songs_async(self, max_videos: int = 1000, pool: "BrowserPool | None" = None) -> list[str]:
         """
-        Scrapes the songs from the user's profile by clicking through videos.
-        Optimized for speed - waits only for necessary elements to load.
+        Scrapes the songs from the user's profile.
+        
+        Video URLs are harvested from the profile grid and each video page
+        is visited directly, several at a time.
         
         Args:
             max_videos: Maximum number of videos to scrape (safety limit).
+            pool: Browser pool to borrow a context from (defaults to the
+                event loop's shared pool).
             
         Returns:
             List of unique song titles found.
         """
-        with sync_playwright() as p:
-            browser, context, page = self._setup_browser(p)
+        if pool is None:
+            pool = self.get_pool(self.headless, os.path.join(self.output_dir, self.STORAGE_STATE_FILE))
+        context = await pool.acquire()
+        
+        try:
+            page = await context.new_page()
+            log.info("Navigating to %s...", self.url)
             
-            try:
-                print(f"Navigating to {self.url}...")
-                
-                if not self._try_load_page(page, max_retries=3):
-                    print("Could not load page after multiple attempts.")
+            if not await self._try_load_page(page, max_retries=3):
+                log.error("Could not load page after multiple attempts.")
+                if self.debug:
                     screenshot_path = self._get_screenshot_path("debug_screenshot.png")
-                    page.screenshot(path=screenshot_path)
-                    print(f"Screenshot saved to {screenshot_path}")
+                    await page.screenshot(path=screenshot_path)
+                    log.info("Screenshot saved to %s", screenshot_path)
                     
                     html_path = self._get_screenshot_path("debug_page.html")
-                    with open(html_path, 'w', encoding='utf-8') as f:
-                        f.write(page.content())
-                    print(f"HTML saved to {html_path}")
-                    return self.songs
-                
-                # Click on the first video
-                print("Clicking on the first video...")
-                first_video = page.locator('div[data-e2e="user-post-item"]').first
-                first_video.click()
-                
-                # Wait for video viewer to open
-                print("Waiting for video viewer to open...")
-                page.wait_for_selector('[data-e2e="browse-video"]', timeout=15000)
-                print("Video viewer opened.")
-                
-                song_titles = set()
-                video_count = 0
-                current_title = self._get_music_title(page)
-                
-                while video_count < max_videos:
-                    video_count += 1
-                    
-                    if current_title:
-                        if current_title not in song_titles:
-                            print(f"[{video_count}] Found: {current_title}")
-                            self.songs.append(current_title)
-                            song_titles.add(current_title)
-                        else:
-                            print(f"[{video_count}] Duplicate: {current_title}")
-                    else:
-                        print(f"[{video_count}] No audio title found")
-                    
-                    # Click next and wait for new content
-                    success, current_title = self._click_next_and_wait_for_change(page, current_title)
-                    if not success:
-                        break
-                
-                print(f"\nScraping complete! Found {len(self.songs)} unique songs from {video_count} videos.")
+                    html = await page.content()
+                    await asyncio.to_thread(self._write_text, html_path, html)
+                    log.info("HTML saved to %s", html_path)
+                return self.songs
+            
+            # This session got us in; share it with later scrapes and runs
+            await pool.save_state(context)
+            
+            deadline = time.monotonic() + self.max_seconds
+            video_urls = await self._collect_video_urls(page, max_videos, deadline)
+            
+            if not video_urls:
+                log.info("No video links found on the profile.")
+                return self.songs
+            
+            log.info("Found %d videos. Fetching up to %d at a time...", len(video_urls), self.VIDEO_CONCURRENCY)
+            video_count = await self._scrape_video_urls(context, video_urls, deadline)
+            log.info("Scraping complete! Found %d unique songs from %d videos.", len(self._songs), video_count)
 
-            except Exception as e:
-                print(f"An error occurred: {e}")
+        except Exception as e:
+            log.error("An error occurred: %s", e)
+            if self.debug:
                 try:
                     screenshot_path = self._get_screenshot_path("error_screenshot.png")
-                    page.screenshot(path=screenshot_path)
-                    print(f"Screenshot saved to {screenshot_path}")
+                    await page.screenshot(path=screenshot_path)
+                    log.info("Screenshot saved to %s", screenshot_path)
                 except Exception:
                     pass
+        finally:
+            await pool.release(context)
+            log.debug("Browser context released.")
+    
+        return self.songs
+
+    async def _collect_video_urls(self, page, max_videos: int, deadline: float) -> list[str]:
+        """
+        Collect video URLs from the profile grid, scrolling to load more.
+        Stops when the grid stops growing, `max_videos` is reached, or the
+        deadline passes.
+        """
+        urls: list[str] = []
+        while time.monotonic() < deadline:
+            previous_count = len(urls)
+            urls = await page.eval_on_selector_all(self.VIDEO_LINK_SELECTOR, self.VIDEO_URLS_JS)
+            if len(urls) >= max_videos:
+                return urls[:max_videos]
+            if previous_count and len(urls) <= previous_count:
+                break
+            
+            await page.evaluate("() => window.scrollTo(0, document.body.scrollHeight)")
+            try:
+                await page.wait_for_function(
+                    self.MORE_VIDEO_URLS_JS,
+                    arg=[self.VIDEO_LINK_SELECTOR, len(urls)],
+                    polling='mutation',
+                    timeout=3000
+                )
+            except PlaywrightTimeout:
+                break
+        return urls
+
+    async def _scrape_video_urls(self, context, video_urls: list[str], deadline: float) -> int:
+        """
+        Resolve every video's title concurrently and record them in grid order.
+        Titles come from the item-detail API over HTTP where possible; only
+        videos it cannot answer for are opened in a page.
+        Returns the number of videos visited.
+        """
+        api_slots = asyncio.Semaphore(self.API_CONCURRENCY)
+        page_slots = asyncio.Semaphore(self.VIDEO_CONCURRENCY)
+        
+        results: list[tuple[bool, str | None] | None] = [None] * len(video_urls)
+        video_count = 0
+        next_index = 0
+        
+        async def record_ready() -> None:
+            # Record finished videos as soon as everything before them is done,
+            # keeping grid order while the rest are still in flight
+            nonlocal video_count, next_index
+            while next_index < len(results) and results[next_index] is not None:
+                visited, title = results[next_index]
+                next_index += 1
+                if visited:
+                    video_count += 1
+                    self._record_title(video_count, title)
+            await self._maybe_checkpoint()
+        
+        async def resolve(url: str) -> tuple[bool, str | None]:
+            if time.monotonic() >= deadline:
+                return False, None
+            async with api_slots:
+                title = await self._fetch_detail_title(context, url)
+            if title:
+                return True, title
+            
+            async with page_slots:
+                if time.monotonic() >= deadline:
+                    return False, None
+                return True, await self._fetch_video_title(context, url)
+        
+        async def fetch(index: int, url: str) -> None:
+            try:
+                results[index] = await resolve(url)
+            except Exception as e:
+                log.warning("Error fetching %s: %s", url, e)
+                results[index] = (True, None)
+            await record_ready()
+        
+        await asyncio.gather(*(fetch(i, url) for i, url in enumerate(video_urls)))
+        if video_count < len(video_urls):
+            log.info("Reached the %.0fs time budget. Skipped %d videos.", self.max_seconds, len(video_urls) - video_count)
+        return video_count
+
+    async def _fetch_detail_title(self, context, url: str) -> str | None:
+        """
+        Ask the item-detail API for a video's music title, without rendering.
+        Sent through the context's request client so it carries the cookies
+        from the profile load. Returns None if the API doesn't answer.
+        """
+        match = self.VIDEO_ID_PATTERN.search(url)
+        if not match:
+            return None
+        try:
+            response = await context.request.get(
+                self.ITEM_DETAIL_API,
+                params={'itemId': match.group(1), 'aid': '1988'},
+                headers={'Referer': url},
+                timeout=10000
+            )
+            try:
+                if not response.ok:
+                    return None
+                return self._title_from_detail(await response.json())
             finally:
-                context.close()
-                browser.close()
-                print("Browser closed.")
+                # Pooled contexts outlive this scrape, so free the body now
+                await response.dispose()
+        except Exception:
+            return None
+
+    async def _fetch_video_title(self, context, url: str) -> str | None:
+        """
+        Open a video page and return its music title.
         
-        return self.songs
+        The title is read from the page's own item-detail API response when
+        one arrives; the rendered DOM is only used as a fallback.
+        """
+        detail_title = asyncio.get_running_loop().create_future()
+        
+        async def on_response(response) -> None:
+            if detail_title.done() or not any(path in response.url for path in self.ITEM_DETAIL_PATHS):
+                return
+            try:
+                title = self._title_from_detail(await response.json())
+            except Exception:
+                return
+            if title and not detail_title.done():
+                detail_title.set_result(title)
+        
+        page = await context.new_page()
+        page.on("response", on_response)
+        try:
+            await page.goto(url, wait_until='domcontentloaded', timeout=15000)
+            try:
+                return await asyncio.wait_for(detail_title, self.DETAIL_RESPONSE_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+            
+            # One wait on the compound selector; resolves as soon as any
+            # music title node is inserted, without polling visibility. The
+            # title is read from that node itself, which may not be rendered
+            # yet, so don't filter it by visibility afterwards.
+            try:
+                handle = await page.wait_for_selector(self.COMBINED_MUSIC_SELECTOR, state='attached', timeout=3000)
+            except PlaywrightTimeout:
+                return None
+            title = (await handle.inner_text()).strip()
+            return title or await self._get_music_title(page)
+        except Exception as e:
+            log.warning("Error loading %s: %s", url, e)
+            return None
+        finally:
+            await page.close()
+
+    @staticmethod
+    def _title_from_detail(data: dict) -> str | None:
+        """Pull the music title out of an item-detail API payload."""
+        item = (data.get('itemInfo') or {}).get('itemStruct') or data.get('aweme_detail') or {}
+        title = (item.get('music') or {}).get('title')
+        return title.strip() if isinstance(title, str) and title.strip() else None
+
+    def _record_title(self, video_count: int, title: str | None) -> None:
+        """Record a video's title, skipping duplicates."""
+        title = title.strip() if title else None
+        if title and title not in self._songs:
+            log.info("[%d] Found: %s", video_count, title)
+            self._songs[title] = None
+        elif title:
+            log.debug("[%d] Duplicate: %s", video_count, title)
+        else:
+            log.debug("[%d] No audio title found", video_count)
+
+    async def _maybe_checkpoint(self) -> None:
+        """Write songs found so far to `checkpoint_path` every CHECKPOINT_EVERY new titles."""
+        if self.checkpoint_path and len(self._songs) - self._checkpointed_count >= self.CHECKPOINT_EVERY:
+            self._checkpointed_count = len(self._songs)
+            # Off the event loop, so the fsync doesn't stall in-flight fetches
+            await asyncio.to_thread(write_json_atomic, self.checkpoint_path, list(self._songs))
+
+    @staticmethod
+    def _write_text(path: str, text: str) -> None:
+        """Write a UTF-8 text file."""
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
 
     def save_to_json(self, filename: str = "songs.json") -> None:
         """Saves the scraped songs to a JSON file."""
-        print(f"Saving {len(self.songs)} songs to {filename}...")
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(self.songs, f, ensure_ascii=False, indent=4)
-        print("Done.")
+        log.info("Saving %d songs to %s...", len(self._songs), filename)
+        write_json_atomic(filename, list(self._songs))
+        log.info("Done.")
+
+
+class BrowserPool:
+    """
+    One long-lived Chromium browser and a fixed set of reusable contexts.
+    
+    Scrapes acquire a context and release it when done. Released contexts
+    are reset (pages closed, cookies cleared) rather than torn down, so
+    neither the browser launch nor context setup is paid per scrape, and
+    `size` bounds how many scrapes run at once.
+    
+    With `storage_state_path`, the pool also keeps one known-good TikTok
+    session: scrapes call `save_state` after a successful profile load, and
+    every context is reset to the latest saved cookies on release instead
+    of to none. The session is loaded from the file at startup.
+    """
+    
+    def __init__(self, size: int = 5, headless: bool = True, storage_state_path: str | None = None):
+        """
+        Initialize the pool. The browser launches on the first acquire.
+        
+        Args:
+            size: Number of contexts (concurrent scrapes).
+            headless: Whether to run Chromium headless.
+            storage_state_path: File to load/save the session's cookies and
+                localStorage, shared by all contexts in the pool.
+        """
+        self.size = size
+        self.headless = headless
+        self.storage_state_path = storage_state_path
+        self._state: dict | None = None
+        self._playwright = None
+        self._browser = None
+        self._idle: asyncio.Queue | None = None
+        self._lock = asyncio.Lock()
+    
+    async def _start(self) -> None:
+        """Launch the browser and its contexts if not already running."""
+        async with self._lock:
+            if self._browser is not None:
+                return
+            self._state = await asyncio.to_thread(self._load_state)
+            self._playwright = await async_playwright().start()
+            try:
+                self._browser = await TikTokScraper._launch_browser(self._playwright, self.headless)
+                contexts = await asyncio.gather(
+                    *(self._new_context() for _ in range(self.size))
+                )
+            except BaseException:
+                # Don't leave a half-started pool behind for the next acquire
+                await self.close()
+                raise
+            self._idle = asyncio.Queue()
+            for context in contexts:
+                self._idle.put_nowait(context)
+    
+    def _load_state(self) -> dict | None:
+        """Read the saved session, if any."""
+        path = self.storage_state_path
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return orjson.loads(f.read())
+        except (OSError, orjson.JSONDecodeError) as e:
+            log.warning("Ignoring unreadable storage state %s: %s", path, e)
+            return None
+    
+    async def _new_context(self):
+        """Open a pool context, starting from the saved session if there is one."""
+        return await TikTokScraper._new_context(self._browser, self._state)
+    
+    async def save_state(self, context) -> None:
+        """Make `context`'s session the one every released context resets to."""
+        if not self.storage_state_path:
+            return
+        try:
+            state = await context.storage_state()
+            self._state = state
+            await asyncio.to_thread(write_json_atomic, self.storage_state_path, state)
+        except Exception as e:
+            log.warning("Could not save storage state: %s", e)
+    
+    async def acquire(self):
+        """Wait for an idle context and take it."""
+        await self._start()
+        idle = self._idle
+        context = await idle.get()
+        if context is None:
+            # A slot whose context couldn't be replaced on release
+            try:
+                context = await self._new_context()
+            except BaseException:
+                idle.put_nowait(None)
+                raise
+        return context
+    
+    async def release(self, context) -> None:
+        """Reset a context and return it to the pool."""
+        idle = self._idle
+        if idle is None:
+            # Pool already closed; its browser took the context with it
+            return
+        try:
+            for page in context.pages:
+                await page.close()
+            # Drop this scrape's cookies; keep only the shared session, if any
+            await context.clear_cookies()
+            if self._state and self._state.get('cookies'):
+                await context.add_cookies(self._state['cookies'])
+        except Exception:
+            # Context is unusable (e.g. it crashed); replace it
+            try:
+                await context.close()
+            except Exception:
+                pass
+            try:
+                context = await self._new_context()
+            except Exception as e:
+                # Keep the slot; the next acquire retries opening a context
+                log.warning("Could not replace a broken browser context: %s", e)
+                context = None
+        
+        # Only hand the slot back if the pool wasn't closed meanwhile
+        if self._idle is idle:
+            idle.put_nowait(context)
+    
+    async def close(self) -> None:
+        """Close the browser and stop the Playwright driver."""
+        browser, playwright = self._browser, self._playwright
+        self._browser = self._playwright = self._idle = None
+        
+        if browser is not None:
+            try:
+                await browser.close()
+                log.info("Browser closed.")
+            except Exception:
+                pass
+        if playwright is not None:
+            try:
+                await playwright.stop()
+            except Exception:
+                pass
+
+
+async def scrape_profiles(usernames: list[str], concurrency: int = 8) -> dict[str, list[str]]:
+    """
+    Scrape several TikTok profiles concurrently in one shared browser.
+    
+    Args:
+        usernames: TikTok usernames to scrape.
+        concurrency: Maximum number of profiles scraped at once.
+        
+    Returns:
+        Mapping of username to its unique song titles.
+    """
+    scrapers = [TikTokScraper(username) for username in usernames]
+    if not scrapers:
+        return {}
+    
+    # One pooled context per concurrent scrape, so the pool is the limiter
+    first = scrapers[0]
+    pool = BrowserPool(
+        size=max(1, min(concurrency, len(scrapers))),
+        headless=first.headless,
+        storage_state_path=os.path.join(first.output_dir, TikTokScraper.STORAGE_STATE_FILE)
+    )
+    try:
+        await asyncio.gather(*(scraper.scrape_songs_async(pool=pool) for scraper in scrapers))
+    finally:
+        await pool.close()
+    
+    return {scraper.username: scraper.songs for scraper in scrapers}
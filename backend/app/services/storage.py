@@ -0,0 +1,35 @@
+"""
+Output Storage Helpers
+
+This module contains helpers for writing scraper/processor output files.
+"""
+
+import os
+import tempfile
+
+import orjson
+
+
+def write_json_atomic(path: str, data) -> None:
+    """
+    Serialize `data` with orjson and atomically replace `path` with it.
+
+    The bytes go to a temp file in the same directory, which is fsynced and
+    renamed over the target, so readers never see a half-written file.
+    """
+    directory = os.path.dirname(path) or "."
+    payload = orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -12,8 +12,9 @@ Usage:
 """
 
 import os
-import json
+import logging
 import argparse
+import orjson
 from dotenv import load_dotenv
 
 from app.services.scraper import TikTokScraper
@@ -32,9 +33,10 @@ def scrape_tiktok(username: str, output_file: str = "raw_songs.json") -> list[st
     print(f"Starting TikTok song scraper for user: {username}")
     print("=" * 50)
     
-    scraper = TikTokScraper(username)
+    output_path = get_output_path(output_file)
+    scraper = TikTokScraper(username, checkpoint_path=output_path)
     scraper.scrape_songs()
-    scraper.save_to_json(get_output_path(output_file))
+    scraper.save_to_json(output_path)
     
     return scraper.songs
 
@@ -50,7 +52,7 @@ def process_with_ai(
     print("Processing audio titles with Gemini AI...")
     print("=" * 50)
     
-    processor = SongProcessor(api_key)
+    processor = SongProcessor(api_key, requests_per_minute=int(os.getenv("GEMINI_RPM", "60")))
     processed_results = processor.process_songs(raw_titles)
     
     processor.save_results(processed_results, get_output_path(raw_output))
@@ -97,6 +99,7 @@ def main():
     args = parser.parse_args()
     
     load_dotenv()
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), format="%(message)s")
     
     tiktok_username = args.profile or os.getenv("PROFILE")
     gemini_api_key = os.getenv("GEMINI_API_KEY")
@@ -114,8 +117,8 @@ def main():
     else:
         raw_songs_path = get_output_path("raw_songs.json")
         try:
-            with open(raw_songs_path, 'r', encoding='utf-8') as f:
-                raw_titles = json.load(f)
+            with open(raw_songs_path, 'rb') as f:
+                raw_titles = orjson.loads(f.read())
             print(f"Loaded {len(raw_titles)} titles from {raw_songs_path}")
         except FileNotFoundError:
             print(f"Error: {raw_songs_path} not found. Run scraper first.")
@@ -0,0 +1,87 @@
+"""Tests for the song and response caches."""
+
+import pytest
+
+# Importing app.services pulls in every service's runtime dependencies
+pytest.importorskip("playwright")
+pytest.importorskip("playwright_stealth")
+pytest.importorskip("google.genai")
+pytest.importorskip("orjson")
+
+from app.services.cache import SemanticCache, TTLCache
+
+
+def song(title: str, is_real_song: bool = True) -> dict:
+    return {"original_title": title, "is_real_song": is_real_song, "song_name": title}
+
+
+def test_exact_hit_ignores_case_and_whitespace():
+    cache = SemanticCache(":memory:")
+    cache.set("Blinding Lights - The Weeknd", song("Blinding Lights - The Weeknd"))
+
+    hit = cache.get("  blinding  LIGHTS - the weeknd ")
+    assert hit["song_name"] == "Blinding Lights - The Weeknd"
+    assert hit["original_title"] == "  blinding  LIGHTS - the weeknd "
+
+
+def test_near_duplicate_hit():
+    cache = SemanticCache(":memory:")
+    cache.set("Blinding Lights - The Weeknd", song("Blinding Lights - The Weeknd"))
+
+    assert cache.get("Blinding Lights - The Weeknd!") is not None
+    assert cache.get("Levitating - Dua Lipa") is None
+
+
+def test_original_sound_prefix_is_part_of_the_key():
+    cache = SemanticCache(":memory:")
+    cache.set("original sound - Cool Song", song("original sound - Cool Song", is_real_song=False))
+
+    assert cache.get("Cool Song") is None
+    assert cache.get("original sound - Cool Song")["is_real_song"] is False
+
+
+def test_numbered_titles_stay_separate():
+    cache = SemanticCache(":memory:")
+    cache.set("Part 1 - Cool Podcast Clips Official", song("Part 1 - Cool Podcast Clips Official", False))
+
+    assert cache.get("Part 2 - Cool Podcast Clips Official") is None
+
+
+def test_expired_entries_miss():
+    cache = SemanticCache(":memory:", ttl=-1)
+    cache.set("Blinding Lights - The Weeknd", song("Blinding Lights - The Weeknd"))
+
+    assert cache.get("Blinding Lights - The Weeknd") is None
+    assert cache.get("Blinding Lights - The Weeknd!") is None
+
+
+def test_entries_persist_across_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    SemanticCache(path).set_many([("Song A", song("Song A")), ("Song B", song("Song B"))])
+
+    reopened = SemanticCache(path)
+    assert len(reopened) == 2
+    assert reopened.get("song a")["song_name"] == "Song A"
+
+
+def test_ttl_cache_expires_entries(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.services.cache.time.monotonic", lambda: now[0])
+    cache = TTLCache(ttl=60)
+    cache.set("user", {"songs": []})
+
+    now[0] += 59
+    assert cache.get("user") == {"songs": []}
+    now[0] += 1
+    assert cache.get("user") is None
+
+
+def test_ttl_cache_evicts_oldest_beyond_max_entries():
+    cache = TTLCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("a", 3)
+    cache.set("c", 4)
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (3, 4)
@@ -0,0 +1,209 @@
+"""Tests for the song processor's batching, retries and result handling."""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+# Importing app.services pulls in every service's runtime dependencies
+pytest.importorskip("playwright")
+pytest.importorskip("playwright_stealth")
+pytest.importorskip("google.genai")
+pytest.importorskip("orjson")
+
+import orjson
+from google.genai import errors
+
+from app.services.cache import SemanticCache
+from app.services.processor import SongProcessor
+from app.services.ratelimit import TokenBucket
+
+
+def song(title: str, is_real_song: bool = True) -> dict:
+    return {"original_title": title, "is_real_song": is_real_song, "song_name": title}
+
+
+class FakeModels:
+    """Stands in for `client.models`; answers with `handler(titles)` and counts calls."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.calls: list[list[str]] = []
+
+    def generate_content(self, model, contents, config):
+        titles = [line.split(". ", 1)[1] for line in contents.splitlines()[1:]]
+        self.calls.append(titles)
+        return SimpleNamespace(text=orjson.dumps(self.handler(titles)).decode())
+
+
+class FakeAsyncModels(FakeModels):
+    async def generate_content(self, model, contents, config):
+        return FakeModels.generate_content(self, model, contents, config)
+
+
+@pytest.fixture
+def make_processor(monkeypatch):
+    monkeypatch.setattr(SongProcessor, "_retry_delay", staticmethod(lambda attempt: 0.0))
+
+    def make(handler):
+        processor = SongProcessor(
+            "test-key",
+            cache=SemanticCache(":memory:"),
+            rate_limiter=TokenBucket(rate=1000, capacity=1000)
+        )
+        models = FakeModels(handler)
+        processor.client = SimpleNamespace(models=models, aio=SimpleNamespace(models=FakeAsyncModels(handler)))
+        return processor, models
+
+    return make
+
+
+def api_error(code: int) -> errors.APIError:
+    cls = errors.ServerError if code >= 500 else errors.ClientError
+    return cls(code, {"error": {"code": code, "message": "boom", "status": "ERROR"}})
+
+
+def test_server_error_is_retried_in_halves(make_processor):
+    def handler(titles):
+        if "bad" in titles and len(titles) > 1:
+            raise api_error(500)
+        return [song(t) for t in titles]
+
+    processor, models = make_processor(handler)
+    results = processor.process_songs(["a", "b", "bad", "c"], batch_size=4)
+
+    assert [r["is_real_song"] for r in results] == [True, True, True, True]
+    assert models.calls[0] == ["a", "b", "bad", "c"]
+    assert ["a", "b"] in models.calls
+
+
+def test_client_error_fails_fast(make_processor):
+    def handler(titles):
+        raise api_error(401)
+
+    processor, models = make_processor(handler)
+    results = processor.process_songs(["a", "b", "c", "d"], batch_size=4)
+
+    assert len(models.calls) == 1
+    assert all(r["is_real_song"] is None and "error" in r for r in results)
+
+
+def test_exhausted_rate_limit_is_not_halved(make_processor):
+    def handler(titles):
+        raise api_error(429)
+
+    processor, models = make_processor(handler)
+    results = processor.process_songs(["a", "b", "c", "d"], batch_size=4)
+
+    assert len(models.calls) == SongProcessor.RATE_LIMIT_RETRIES + 1
+    assert all(call == ["a", "b", "c", "d"] for call in models.calls)
+    assert all(r["is_real_song"] is None for r in results)
+
+
+def test_rate_limit_retries_then_succeeds(make_processor):
+    def handler(titles):
+        if len(models.calls) < 3:
+            raise api_error(429)
+        return [song(t) for t in titles]
+
+    processor, models = make_processor(handler)
+    results = processor.process_songs(["a", "b"], batch_size=2)
+
+    assert len(models.calls) == 3
+    assert [r["is_real_song"] for r in results] == [True, True]
+
+
+def test_retries_stay_within_call_budget(make_processor):
+    def handler(titles):
+        raise TimeoutError("slow")
+
+    processor, models = make_processor(handler)
+    titles = [f"t{i}" for i in range(8)]
+    processor.process_songs(titles, batch_size=8)
+
+    assert len(models.calls) <= 2 * len(titles) - 1 + SongProcessor.RATE_LIMIT_RETRIES
+
+
+def test_async_client_error_fails_fast(make_processor):
+    def handler(titles):
+        raise api_error(403)
+
+    processor, _ = make_processor(handler)
+    results = asyncio.run(processor.aprocess_songs(["a", "b", "c"], batch_size=3))
+
+    assert len(processor.client.aio.models.calls) == 1
+    assert all(r["is_real_song"] is None for r in results)
+
+
+def test_async_server_error_is_retried_in_halves(make_processor):
+    def handler(titles):
+        if "bad" in titles and len(titles) > 1:
+            raise api_error(503)
+        return [song(t) for t in titles]
+
+    processor, _ = make_processor(handler)
+    results = asyncio.run(processor.aprocess_songs(["a", "bad", "c", "d"], batch_size=4))
+
+    assert [r["is_real_song"] for r in results] == [True, True, True, True]
+
+
+def test_duplicate_titles_are_sent_once_and_fanned_out(make_processor):
+    processor, models = make_processor(lambda titles: [song(t) for t in titles])
+    raw_titles = ["Song A", "song  a", "Song B", "SONG A"]
+    results = processor.process_songs(raw_titles, batch_size=10)
+
+    assert models.calls == [["Song A", "Song B"]]
+    assert [r["original_title"] for r in results] == raw_titles
+    assert [r["song_name"] for r in results] == ["Song A", "Song A", "Song B", "Song A"]
+
+
+def test_cached_titles_skip_gemini(make_processor):
+    processor, models = make_processor(lambda titles: [song(t) for t in titles])
+    processor.process_songs(["Song A", "Song B"])
+    results = processor.process_songs(["song a", "Song B", "Song C"])
+
+    assert models.calls == [["Song A", "Song B"], ["Song C"]]
+    assert [r["original_title"] for r in results] == ["song a", "Song B", "Song C"]
+
+
+def test_parse_response_strips_code_fences(make_processor):
+    processor, _ = make_processor(None)
+    text = "```json\n" + orjson.dumps([song("a")]).decode() + "\n```"
+
+    assert processor._parse_response(text, ["a"]) == [song("a")]
+
+
+def test_parse_response_salvages_truncated_output(make_processor):
+    processor, _ = make_processor(None)
+    text = '[{"original_title": "a", "is_real_song": true}, {"original_title": "b", "is_re'
+
+    assert processor._parse_response(text, ["a", "b"]) == [{"original_title": "a", "is_real_song": True}]
+
+
+def test_parse_response_marks_unparseable_batch(make_processor):
+    processor, _ = make_processor(None)
+    results = processor._parse_response("not json at all", ["a", "b"])
+
+    assert [r["original_title"] for r in results] == ["a", "b"]
+    assert all(r["parse_error"] and r["is_real_song"] is None for r in results)
+
+
+def test_salvage_objects_skips_malformed_and_untitled_objects():
+    text = '{"original_title": "a"} {"broken": } {"notes": "no title"} {"original_title": "b", "x": {"y": 1}}'
+
+    assert SongProcessor._salvage_objects(text) == [
+        {"original_title": "a"},
+        {"original_title": "b", "x": {"y": 1}},
+    ]
+
+
+def test_pair_results_matches_echoed_titles_then_order(make_processor):
+    processor, _ = make_processor(None)
+    titles = ["Song A", "Song B", "Song C"]
+    results = [song("song b"), song("Tidied Title"), song("SONG A")]
+
+    assert processor._pair_results(titles, results) == [
+        ("Song B", song("song b")),
+        ("Song A", song("SONG A")),
+        ("Song C", song("Tidied Title")),
+    ]
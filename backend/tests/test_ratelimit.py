@@ -0,0 +1,78 @@
+"""Tests for the token-bucket rate limiter."""
+
+import asyncio
+
+import pytest
+
+# Importing app.services pulls in every service's runtime dependencies
+pytest.importorskip("playwright")
+pytest.importorskip("playwright_stealth")
+pytest.importorskip("google.genai")
+pytest.importorskip("orjson")
+
+from app.services import ratelimit
+from app.services.ratelimit import TokenBucket
+
+
+class FakeClock:
+    """Replaces time.monotonic/time.sleep so waits advance time instantly."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept: list[float] = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(ratelimit.time, "sleep", clock.sleep)
+    return clock
+
+
+def test_rejects_non_positive_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
+
+
+def test_burst_then_paced(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+    for _ in range(3):
+        bucket.wait()
+    assert clock.slept == []
+
+    bucket.wait()
+    assert clock.slept == [pytest.approx(0.5)]
+
+
+def test_refill_is_capped_at_capacity(clock):
+    bucket = TokenBucket(rate=1, capacity=2)
+    clock.now += 100
+    for _ in range(2):
+        bucket.wait()
+    assert clock.slept == []
+
+    bucket.wait()
+    assert clock.slept == [pytest.approx(1.0)]
+
+
+def test_acquire_waits_without_blocking(clock, monkeypatch):
+    async def fake_sleep(seconds):
+        clock.sleep(seconds)
+
+    monkeypatch.setattr(ratelimit.asyncio, "sleep", fake_sleep)
+    bucket = TokenBucket(rate=4, capacity=1)
+
+    async def run():
+        await bucket.acquire()
+        await bucket.acquire()
+
+    asyncio.run(run())
+    assert clock.slept == [pytest.approx(0.25)]
@@ -0,0 +1,109 @@
+"""Tests for the TikTok scraper's request blocking and grid harvesting."""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+# Importing app.services pulls in every service's runtime dependencies
+pytest.importorskip("playwright")
+pytest.importorskip("playwright_stealth")
+pytest.importorskip("google.genai")
+pytest.importorskip("orjson")
+
+from app.services.scraper import TikTokScraper
+
+
+class StubRoute:
+    """Minimal stand-in for a Playwright Route that records what was done."""
+
+    def __init__(self, resource_type: str, url: str):
+        self.request = SimpleNamespace(resource_type=resource_type, url=url)
+        self.outcome = None
+
+    async def abort(self) -> None:
+        self.outcome = "aborted"
+
+    async def continue_(self) -> None:
+        self.outcome = "continued"
+
+
+@pytest.mark.parametrize(
+    ("resource_type", "url", "expected"),
+    [
+        ("image", "https://p16-sign.tiktokcdn.com/thumb.jpeg", "aborted"),
+        ("media", "https://v16-webapp.tiktok.com/video.mp4", "aborted"),
+        ("font", "https://sf16-website.tiktokcdn.com/font.woff2", "aborted"),
+        ("stylesheet", "https://sf16-website.tiktokcdn.com/app.css", "aborted"),
+        ("script", "https://www.googletagmanager.com/gtag/js", "aborted"),
+        ("xhr", "https://mon.tiktokv.com/monitor_browser/collect", "aborted"),
+        ("document", "https://www.tiktok.com/@user", "continued"),
+        ("xhr", "https://www.tiktok.com/api/item/detail/?itemId=1", "continued"),
+        ("script", "https://sf16-website.tiktokcdn.com/app.js", "continued"),
+    ],
+)
+def test_block_unneeded_requests(resource_type, url, expected):
+    route = StubRoute(resource_type, url)
+    asyncio.run(TikTokScraper._block_unneeded_requests(route))
+    assert route.outcome == expected
+
+
+class StubGridPage:
+    """Profile grid whose links never grow; wait_for_function resolves at once."""
+
+    def __init__(self, urls: list[str]):
+        self.urls = urls
+        self.reads = 0
+
+    async def eval_on_selector_all(self, selector, expression):
+        self.reads += 1
+        return list(self.urls)
+
+    async def evaluate(self, expression):
+        return None
+
+    async def wait_for_function(self, expression, arg=None, polling=None, timeout=None):
+        return None
+
+
+def test_collect_video_urls_stops_when_grid_stops_growing():
+    page = StubGridPage(["https://www.tiktok.com/@u/video/1", "https://www.tiktok.com/@u/video/2"])
+    scraper = TikTokScraper("u")
+    urls = asyncio.run(scraper._collect_video_urls(page, max_videos=100, deadline=time.monotonic() + 60))
+    assert urls == page.urls
+    assert page.reads == 2
+
+
+def test_collect_video_urls_caps_at_max_videos():
+    page = StubGridPage([f"https://www.tiktok.com/@u/video/{i}" for i in range(10)])
+    scraper = TikTokScraper("u")
+    urls = asyncio.run(scraper._collect_video_urls(page, max_videos=3, deadline=time.monotonic() + 60))
+    assert urls == page.urls[:3]
+
+
+class StubResponse:
+    def __init__(self, ok: bool, body: dict):
+        self.ok = ok
+        self.body = body
+        self.disposed = False
+
+    async def json(self):
+        return self.body
+
+    async def dispose(self):
+        self.disposed = True
+
+
+@pytest.mark.parametrize("ok", [True, False])
+def test_fetch_detail_title_disposes_response(ok):
+    response = StubResponse(ok, {"itemInfo": {"itemStruct": {"music": {"title": "Song"}}}})
+
+    async def get(*args, **kwargs):
+        return response
+
+    context = SimpleNamespace(request=SimpleNamespace(get=get))
+    scraper = TikTokScraper("u")
+    title = asyncio.run(scraper._fetch_detail_title(context, "https://www.tiktok.com/@u/video/123"))
+    assert title == ("Song" if ok else None)
+    assert response.disposed
@@ -0,0 +1,40 @@
+"""Tests for the atomic JSON writer."""
+
+import os
+
+import pytest
+
+# Importing app.services pulls in every service's runtime dependencies
+pytest.importorskip("playwright")
+pytest.importorskip("playwright_stealth")
+pytest.importorskip("google.genai")
+pytest.importorskip("orjson")
+
+import orjson
+
+from app.services import storage
+from app.services.storage import write_json_atomic
+
+
+def test_writes_and_replaces(tmp_path):
+    path = tmp_path / "songs.json"
+    write_json_atomic(str(path), {"songs": ["a"]})
+    write_json_atomic(str(path), {"songs": ["a", "b"], 1: "non-str key"})
+
+    assert orjson.loads(path.read_bytes()) == {"songs": ["a", "b"], "1": "non-str key"}
+    assert os.listdir(tmp_path) == ["songs.json"]
+
+
+def test_failed_write_keeps_old_file_and_cleans_up(tmp_path, monkeypatch):
+    path = tmp_path / "songs.json"
+    write_json_atomic(str(path), ["old"])
+
+    def fail_replace(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(storage.os, "replace", fail_replace)
+    with pytest.raises(OSError):
+        write_json_atomic(str(path), ["new"])
+
+    assert orjson.loads(path.read_bytes()) == ["old"]
+    assert os.listdir(tmp_path) == ["songs.json"]